@@ -1,7 +1,7 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import shutil
 import os
 from pathlib import Path
@@ -14,7 +14,7 @@ from services.document_processor import DocumentProcessor
 from services.embeddings import EmbeddingService
 from services.vector_store import VectorStore
 from models.llm_handler import LLMHandler
-from utils.config import config
+from utils.config import config, init_app
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -59,14 +59,20 @@ async def startup_event():
     
     try:
         logger.info("Initializing services...")
+        init_app()
         
         # Initialize services
         document_processor = DocumentProcessor()
         embedding_service = EmbeddingService()
+        if config.EMBEDDING_PRELOAD:
+            # Load (and for ONNX/OpenVINO, export) the model now, so the first query or
+            # upload doesn't block the event loop doing it; under a pre-forking server
+            # this also shares the weights with the workers
+            embedding_service.model
         
-        # Get embedding dimension for vector store
-        embedding_dim = embedding_service.get_embedding_dimension()
-        vector_store = VectorStore(dimension=embedding_dim)
+        # The vector store reads its dimension from the saved index, or from the first
+        # batch it is given, so it doesn't need the embedding model
+        vector_store = VectorStore(embedding_id=embedding_service.embedding_id)
         
         llm_handler = LLMHandler()
         
@@ -200,6 +206,31 @@ async def process_document_background(file_path: str):
     except Exception as e:
         logger.error(f"Error processing document {file_path}: {e}")
 
+NO_CONTEXT_ANSWER = "I couldn't find any relevant information in the uploaded documents to answer your question."
+
+def retrieve_context(question: str, top_k: int):
+    """Find the chunks most relevant to a question, returning their texts and source summaries"""
+    # Generate query embedding
+    query_embedding = embedding_service.encode_single_text(question)
+    
+    # Search vector store
+    search_results = vector_store.search(query_embedding, top_k=top_k)
+    
+    # Extract context from search results
+    context_texts = []
+    sources = []
+    
+    for result in search_results:
+        context_texts.append(result["text"])
+        sources.append({
+            "text": result["text"][:200] + "..." if len(result["text"]) > 200 else result["text"],
+            "similarity_score": result.get("similarity_score", 0),
+            "chunk_id": result.get("chunk_id", 0),
+            "file_name": result.get("metadata", {}).get("file_name", "Unknown")
+        })
+    
+    return context_texts, sources
+
 @app.post("/query", response_model=QueryResponse)
 async def query_documents(request: QueryRequest):
     """Query the document collection"""
@@ -210,32 +241,15 @@ async def query_documents(request: QueryRequest):
         
         top_k = request.top_k or config.TOP_K_RESULTS
         
-        # Generate query embedding
-        query_embedding = embedding_service.encode_single_text(question)
+        context_texts, sources = retrieve_context(question, top_k)
         
-        # Search vector store
-        search_results = vector_store.search(query_embedding, top_k=top_k)
-        
-        if not search_results:
+        if not context_texts:
             return QueryResponse(
-                answer="I couldn't find any relevant information in the uploaded documents to answer your question.",
+                answer=NO_CONTEXT_ANSWER,
                 sources=[],
                 query=question
             )
         
-        # Extract context from search results
-        context_texts = []
-        sources = []
-        
-        for result in search_results:
-            context_texts.append(result["text"])
-            sources.append({
-                "text": result["text"][:200] + "..." if len(result["text"]) > 200 else result["text"],
-                "similarity_score": result.get("similarity_score", 0),
-                "chunk_id": result.get("chunk_id", 0),
-                "file_name": result.get("metadata", {}).get("file_name", "Unknown")
-            })
-        
         # Generate answer using LLM
         answer = await llm_handler.generate_response(question, context_texts)
         
@@ -251,6 +265,59 @@ async def query_documents(request: QueryRequest):
         logger.error(f"Error processing query: {e}")
         raise HTTPException(status_code=500, detail=f"Query error: {str(e)}")
 
+@app.websocket("/ws/query")
+async def query_websocket(websocket: WebSocket):
+    """Answer queries over a persistent connection
+    
+    Each request frame is a QueryRequest as JSON. The reply is a "sources"
+    frame, a "token" frame per generated token and a final "answer" frame
+    with the full text, or a single "error" frame.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                payload = await websocket.receive_json()
+            except ValueError as e:
+                # A frame that isn't JSON only fails that query, not the connection
+                await websocket.send_json({"type": "error", "error": f"Invalid query: {str(e)}"})
+                continue
+            try:
+                request = QueryRequest(**payload)
+            except (TypeError, ValidationError) as e:
+                await websocket.send_json({"type": "error", "error": f"Invalid query: {str(e)}"})
+                continue
+            
+            question = request.question.strip()
+            if not question:
+                await websocket.send_json({"type": "error", "error": "Question cannot be empty"})
+                continue
+            
+            top_k = request.top_k or config.TOP_K_RESULTS
+            
+            try:
+                context_texts, sources = retrieve_context(question, top_k)
+                await websocket.send_json({"type": "sources", "sources": sources})
+                
+                if context_texts:
+                    tokens = []
+                    async for token in llm_handler.stream_response(question, context_texts):
+                        tokens.append(token)
+                        await websocket.send_json({"type": "token", "token": token})
+                    answer = "".join(tokens)
+                else:
+                    answer = NO_CONTEXT_ANSWER
+                
+                await websocket.send_json({"type": "answer", "answer": answer, "query": question})
+            except WebSocketDisconnect:
+                # The client is gone, so there is no one to report an error to
+                raise
+            except Exception as e:
+                logger.error(f"Error processing query: {e}")
+                await websocket.send_json({"type": "error", "error": f"Query error: {str(e)}"})
+    except WebSocketDisconnect:
+        pass
+
 @app.get("/documents")
 async def list_documents():
     """List information about stored documents"""
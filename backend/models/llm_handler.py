@@ -1,20 +1,22 @@
 import ollama
 import httpx
-from typing import List, Dict, Any
-from utils import config
+import logging
+from typing import List, Dict, Any, AsyncIterator
+from utils.config import config
+
+logger = logging.getLogger(__name__)
 
 class LLMHandler:
     def __init__(self):
-        self.client = ollama.Client(host=config.config.OLLAMA_HOST)
-        self.model = config.config.OLLAMA_MODEL
+        self.client = ollama.Client(host=config.OLLAMA_HOST)
+        self.async_client = ollama.AsyncClient(host=config.OLLAMA_HOST)
+        self.model = config.OLLAMA_MODEL
 
-    async def generate_response(self, prompt: str, context: List[str] = None) -> str:
-        """Generate response using LLAMA model with optional context"""
-        try:
-            # Prepare the prompt with context if provided
-            if context:
-                context_text = "\n\n".join(context)
-                full_prompt = f"""
+    def _build_prompt(self, prompt: str, context: List[str] = None) -> str:
+        """Prepare the prompt with context if provided"""
+        if context:
+            context_text = "\n\n".join(context)
+            return f"""
 Context information:
 {context_text}
 
@@ -23,8 +25,12 @@ Question: {prompt}
 Based on the context provided above, please answer the question. If the answer cannot be found in the context, please say so.
 
 Answer:"""
-            else:
-                full_prompt = prompt
+        return prompt
+
+    async def generate_response(self, prompt: str, context: List[str] = None) -> str:
+        """Generate response using LLAMA model with optional context"""
+        try:
+            full_prompt = self._build_prompt(prompt, context)
             
             # Generate response using Ollama
             response = self.client.chat(
@@ -43,6 +49,34 @@ Answer:"""
             print(f"Error generating response: {e}")
             return f"Sorry, I encountered an error while generating the response: {str(e)}"
     
+    async def stream_response(self, prompt: str, context: List[str] = None) -> AsyncIterator[str]:
+        """Generate response token by token using LLAMA model with optional context
+        
+        Failures are raised, not yielded as text, so callers can report them as errors.
+        """
+        try:
+            full_prompt = self._build_prompt(prompt, context)
+            
+            stream = await self.async_client.chat(
+                model=self.model,
+                messages=[
+                    {
+                        'role': 'user',
+                        'content': full_prompt
+                    }
+                ],
+                stream=True
+            )
+            
+            async for part in stream:
+                token = part['message']['content']
+                if token:
+                    yield token
+                    
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+            raise
+    
     async def test_connection(self) -> bool:
         """Test if Ollama service is available"""
         try:
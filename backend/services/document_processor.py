@@ -4,14 +4,14 @@ import tiktoken
 from typing import List, Dict, Any
 from pathlib import Path
 import logging
-from utils import config
+from utils.config import config
 
 logger = logging.getLogger(__name__)
 
 class DocumentProcessor:
     def __init__(self):
-        self.chunk_size = config.config.CHUNK_SIZE
-        self.chunk_overlap = config.config.CHUNK_OVERLAP
+        self.chunk_size = config.CHUNK_SIZE
+        self.chunk_overlap = config.CHUNK_OVERLAP
         # Initialize tokenizer for token counting
         try:
             self.tokenizer = tiktoken.get_encoding("cl100k_base")
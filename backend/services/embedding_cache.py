@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+import logging
+from utils.config import config
+
+logger = logging.getLogger(__name__)
+
+# Stay under SQLite's default limit on bound parameters per statement
+_MAX_KEYS_PER_QUERY = 500
+
+class EmbeddingCache:
+    """Content-addressed store of float16 embeddings backed by SQLite"""
+    
+    def __init__(self, db_path: str = None):
+        if db_path is None:
+            db_path = Path(config.VECTOR_STORE_PATH) / "embedding_cache.sqlite"
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key BLOB PRIMARY KEY, dim INTEGER NOT NULL, vec BLOB NOT NULL)"
+        )
+        self._conn.commit()
+    
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Look up cached embeddings, returning only the keys that were found"""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _MAX_KEYS_PER_QUERY):
+                batch = keys[start:start + _MAX_KEYS_PER_QUERY]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, dim, vec FROM cache WHERE key IN ({placeholders})", batch
+                )
+                for key, dim, vec in rows:
+                    found[key] = np.frombuffer(vec, dtype=np.float16, count=dim)
+        return found
+    
+    def put_many(self, items: Iterable[Tuple[bytes, np.ndarray]]):
+        """Store embeddings under their keys, replacing any existing entries"""
+        rows = [
+            (key, len(vector), np.asarray(vector, dtype=np.float16).tobytes())
+            for key, vector in items
+        ]
+        if not rows:
+            return
+        
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO cache (key, dim, vec) VALUES (?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            # A failed write only costs a re-encode next time
+            logger.warning(f"Could not write embedding cache: {e}")
@@ -1,40 +1,128 @@
+import os
+
+# The Rust tokenizers read this when they are first imported, so set it before sentence-transformers
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+
 from sentence_transformers import SentenceTransformer
+import faiss
+import hashlib
 import numpy as np
+from pathlib import Path
 from typing import List, Dict, Any
 import logging
-from utils import config
+from utils.config import config
+from services.embedding_cache import EmbeddingCache
 
 logger = logging.getLogger(__name__)
 
 class EmbeddingService:
     def __init__(self):
-        self.model_name = config.config.EMBEDDING_MODEL
-        self.device = config.config.EMBEDDING_DEVICE
-        self.model = None
-        self._load_model()
+        self.model_name = config.EMBEDDING_MODEL
+        self.device = config.EMBEDDING_DEVICE
+        self.backend = config.EMBEDDING_BACKEND
+        # Which graph produces the vectors: ONNX files of the same model (int8 vs fp32) differ
+        self.model_variant = self.backend
+        if self.backend == "onnx" and config.EMBEDDING_ONNX_FILE:
+            self.model_variant = f"{self.backend}:{config.EMBEDDING_ONNX_FILE}"
+        # The model is loaded on first use, see the model property
+        self._model = None
+        # Fixed once the model is loaded, so read them from it only once
+        self._dim = None
+        self._max_seq = None
+        # (corpus, index) for the last corpus searched, rebuilt when a different corpus is passed
+        self._corpus_index = None
+        self.cache = EmbeddingCache()
+    
+    @property
+    def embedding_id(self) -> str:
+        """Identifies the vectors this service produces; indexes built from another id aren't comparable"""
+        return f"{self.model_name} ({self.model_variant})"
+    
+    @property
+    def model(self) -> SentenceTransformer:
+        """The embedding model, loaded on first access; raises if loading fails, so it is never None
+        
+        Servers that fork workers after importing the app (e.g. gunicorn --preload) can
+        touch this once in the parent so the weights are shared copy-on-write.
+        """
+        if self._model is None:
+            self._load_model()
+        return self._model
     
     def _load_model(self):
         """Load the embedding model"""
         try:
-            self.model = SentenceTransformer(
-                self.model_name,
-                device=self.device
-            )
-            logger.info(f"Loaded embedding model: {self.model_name}")
+            if self.backend == "torch":
+                self._configure_torch_threads()
+                self._model = SentenceTransformer(
+                    self.model_name,
+                    device=self.device
+                )
+            else:
+                self._model = self._load_exported_model()
+            tokenizer = getattr(self._model, 'tokenizer', None)
+            if tokenizer is not None and not getattr(tokenizer, 'is_fast', False):
+                logger.warning(f"Embedding model {self.model_name} uses a slow Python tokenizer")
+            self._dim = self._model.get_sentence_embedding_dimension()
+            self._max_seq = getattr(self._model, 'max_seq_length', None)
+            logger.info(f"Loaded embedding model: {self.model_name} ({self.backend})")
         except Exception as e:
             logger.error(f"Error loading embedding model: {e}")
             raise
     
-    def encode_texts(self, texts: List[str]) -> np.ndarray:
-        """Generate embeddings for a list of texts"""
-        if not self.model:
-            raise RuntimeError("Embedding model not loaded")
+    def _configure_torch_threads(self):
+        """Size torch's thread pools for CPU inference before the model runs"""
+        import torch
+        torch.set_num_threads(config.TORCH_NUM_THREADS or os.cpu_count())
+        try:
+            torch.set_num_interop_threads(2)
+        except RuntimeError:
+            # Can only be set before torch first runs parallel work
+            logger.debug("torch inter-op threads already initialized")
+    
+    def _load_exported_model(self) -> SentenceTransformer:
+        """Load the ONNX/OpenVINO graph, exporting it on first use and reusing the saved copy afterwards"""
+        cache_name = f"{self.model_name}-{self.model_variant}".replace("/", "--").replace(":", "--")
+        cache_dir = Path(config.VECTOR_STORE_PATH) / "model_cache" / cache_name
+        model_kwargs = {}
+        if self.backend == "onnx":
+            model_kwargs["provider"] = "CPUExecutionProvider"
+        
+        if cache_dir.exists():
+            # Load whichever graph was saved last time rather than exporting again
+            cached = next(cache_dir.rglob("*.onnx" if self.backend == "onnx" else "*.xml"), None)
+            if cached:
+                model_kwargs["file_name"] = str(cached.relative_to(cache_dir))
+            return SentenceTransformer(
+                str(cache_dir),
+                device=self.device,
+                backend=self.backend,
+                model_kwargs=model_kwargs
+            )
         
+        # Prefer the published int8 graph; sentence-transformers exports one if it is missing
+        if self.backend == "onnx" and config.EMBEDDING_ONNX_FILE:
+            model_kwargs["file_name"] = config.EMBEDDING_ONNX_FILE
+        model = SentenceTransformer(
+            self.model_name,
+            device=self.device,
+            backend=self.backend,
+            model_kwargs=model_kwargs
+        )
+        model.save_pretrained(str(cache_dir))
+        logger.info(f"Saved {self.backend} embedding model to {cache_dir}")
+        return model
+    
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """Generate L2-normalized embeddings for a list of texts"""
         try:
+            # encode() already length-sorts texts so each batch pads to similar lengths
             embeddings = self.model.encode(
                 texts,
-                show_progress_bar=True,
-                convert_to_numpy=True
+                batch_size=config.EMBED_BATCH_SIZE,
+                show_progress_bar=len(texts) > 256,
+                convert_to_numpy=True,
+                normalize_embeddings=True
             )
             return embeddings
         except Exception as e:
@@ -42,8 +130,23 @@ class EmbeddingService:
             raise
     
     def encode_single_text(self, text: str) -> np.ndarray:
-        """Generate embedding for a single text"""
-        return self.encode_texts([text])[0]
+        """Generate the L2-normalized embedding for a single text"""
+        try:
+            # A plain string goes through encode() as-is and comes back 1-D
+            return self.model.encode(
+                text,
+                batch_size=config.EMBED_BATCH_SIZE,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+        except Exception as e:
+            logger.error(f"Error generating embedding: {e}")
+            raise
+    
+    def _cache_key(self, text: str) -> bytes:
+        """Cache key for a text; includes the model, backend and ONNX graph so switching any of them never reuses stale vectors"""
+        return hashlib.sha256(f"{self.model_name}\0{self.model_variant}\0{text}".encode()).digest()
     
     def encode_chunks(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Generate embeddings for document chunks"""
@@ -54,12 +157,23 @@ class EmbeddingService:
             # Extract texts from chunks
             texts = [chunk["text"] for chunk in chunks]
             
-            # Generate embeddings
-            embeddings = self.encode_texts(texts)
+            # Reuse embeddings of chunks seen before and only encode the rest
+            keys = [self._cache_key(text) for text in texts]
+            cached = self.cache.get_many(keys)
+            missing = [i for i, key in enumerate(keys) if key not in cached]
+            if missing:
+                # Embeddings come back L2-normalized, so similarity is a plain dot product.
+                # Unit vectors lose almost nothing in half precision, and it halves their memory
+                new_embeddings = self.encode_texts([texts[i] for i in missing]).astype(np.float16)
+                new_items = [(keys[i], embedding) for i, embedding in zip(missing, new_embeddings)]
+                self.cache.put_many(new_items)
+                cached.update(new_items)
+            logger.info(f"Embedding cache: {len(keys) - len(missing)} hits, {len(missing)} encoded")
             
-            # Add embeddings to chunks
-            for i, chunk in enumerate(chunks):
-                chunk["embedding"] = embeddings[i]
+            embeddings = np.stack([cached[key] for key in keys])
+            
+            for chunk, embedding in zip(chunks, embeddings):
+                chunk["embedding"] = embedding
             
             return chunks
             
@@ -69,18 +183,52 @@ class EmbeddingService:
     
     def get_embedding_dimension(self) -> int:
         """Get the dimension of embeddings produced by the model"""
-        if not self.model:
-            return None
-        return self.model.get_sentence_embedding_dimension()
+        if self._model is None:
+            self._load_model()
+        return self._dim
     
     def similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
-        """Calculate cosine similarity between two embeddings"""
-        # Normalize embeddings
-        embedding1 = embedding1 / np.linalg.norm(embedding1)
-        embedding2 = embedding2 / np.linalg.norm(embedding2)
+        """Calculate cosine similarity between two embeddings
         
-        # Calculate cosine similarity
-        return np.dot(embedding1, embedding2)
+        Both inputs must be unit vectors, as returned by encode_texts, so the dot product is the cosine.
+        """
+        return float(np.dot(embedding1, embedding2))
+    
+    def _get_corpus_index(self, corpus_embeddings: np.ndarray):
+        """Search structure for the corpus, built once and reused while the same matrix is searched
+        
+        A FAISS inner-product index by default, or the contiguous matrix itself for the
+        Numba kernels; float16 corpora stay float16 there and are widened while scanning.
+        
+        The cache is keyed on the matrix object, so a corpus must not be modified in
+        place once searched; pass a new array instead.
+        """
+        # Read and replace the (matrix, index) pair as one value, so concurrent searches
+        # of different corpora never pair one corpus with another's index
+        cached = self._corpus_index
+        if cached is not None and cached[0] is corpus_embeddings:
+            return cached[1]
+        
+        if config.SIMILAR_TEXTS_BACKEND == "numba":
+            dtype = np.float16 if corpus_embeddings.dtype == np.float16 else np.float32
+            corpus_index = np.ascontiguousarray(corpus_embeddings, dtype=dtype)
+        else:
+            matrix = np.ascontiguousarray(corpus_embeddings, dtype=np.float32)
+            corpus_index = faiss.IndexFlatIP(matrix.shape[1])
+            corpus_index.add(matrix)
+        # Holding the matrix keeps its identity valid as the cache key
+        self._corpus_index = (corpus_embeddings, corpus_index)
+        return corpus_index
+    
+    def _search(self, query_embeddings: np.ndarray, corpus_embeddings: np.ndarray, top_k: int):
+        """Top-k scores and row indices for each query, best first"""
+        corpus_index = self._get_corpus_index(corpus_embeddings)
+        if config.SIMILAR_TEXTS_BACKEND == "numba":
+            from services.sim_kernel import topk_dot, topk_dot_f16
+            kernel = topk_dot_f16 if corpus_index.dtype == np.float16 else topk_dot
+            hits = [kernel(corpus_index, query, top_k) for query in query_embeddings]
+            return [scores for _, scores in hits], [indices for indices, _ in hits]
+        return corpus_index.search(query_embeddings, top_k)
     
     def find_similar_texts(self, 
                           query_text: str, 
@@ -88,39 +236,60 @@ class EmbeddingService:
                           corpus_texts: List[str],
                           top_k: int = None) -> List[Dict[str, Any]]:
         """Find most similar texts to query"""
+        return self.find_similar_texts_batch([query_text], corpus_embeddings, corpus_texts, top_k)[0]
+    
+    def find_similar_texts_batch(self,
+                                 queries: List[str],
+                                 corpus_embeddings: np.ndarray,
+                                 corpus_texts: List[str],
+                                 top_k: int = None) -> List[List[Dict[str, Any]]]:
+        """Find the most similar texts for each query with one encode call and one corpus search
+        
+        All queries go through the model as one batch, and the FAISS path scores the
+        whole (queries x corpus) block in a single call.
+        
+        Expects corpus_embeddings to be L2-normalized rows, as produced by encode_chunks,
+        so inner product equals cosine similarity. The index built for it is reused while
+        the same array is passed, so don't modify the array in place between searches.
+        """
         if top_k is None:
             top_k = config.TOP_K_RESULTS
         
-        # Generate query embedding
-        query_embedding = self.encode_single_text(query_text)
+        # Never ask for more results than the corpus holds; FAISS would pad with -1
+        top_k = min(top_k, len(corpus_embeddings))
+        if top_k <= 0:
+            return [[] for _ in queries]
         
-        # Calculate similarities
-        similarities = []
-        for i, corpus_embedding in enumerate(corpus_embeddings):
-            sim_score = self.similarity(query_embedding, corpus_embedding)
-            similarities.append({
-                "index": i,
-                "text": corpus_texts[i],
-                "similarity": float(sim_score)
-            })
+        # Generate query embeddings
+        query_embeddings = self.encode_texts(queries).astype(np.float32, copy=False)
         
-        # Sort by similarity and return top k
-        similarities.sort(key=lambda x: x["similarity"], reverse=True)
-        return similarities[:top_k]
+        scores, indices = self._search(query_embeddings, corpus_embeddings, top_k)
+        return [
+            [
+                {
+                    "index": int(i),
+                    "text": corpus_texts[i],
+                    "similarity": float(score)
+                }
+                for score, i in zip(row_scores, row_indices)
+            ]
+            for row_scores, row_indices in zip(scores, indices)
+        ]
     
     def get_model_info(self) -> Dict[str, Any]:
-        """Get information about the embedding model"""
-        if not self.model:
+        """Get information about the embedding model, without loading it"""
+        if self._model is None:
             return {
                 "model_name": self.model_name,
                 "loaded": False,
-                "error": "Model not loaded"
+                "backend": self.backend
             }
         
         return {
             "model_name": self.model_name,
             "loaded": True,
             "device": self.device,
-            "embedding_dimension": self.get_embedding_dimension(),
-            "max_sequence_length": getattr(self.model, 'max_seq_length', 'Unknown')
+            "backend": self.backend,
+            "embedding_dimension": self._dim,
+            "max_sequence_length": self._max_seq if self._max_seq is not None else 'Unknown'
         }
\ No newline at end of file
@@ -0,0 +1,117 @@
+import numba
+import numpy as np
+from numba import njit, prange
+
+# Exact top-k search kernels, used by EmbeddingService.find_similar_texts* instead of
+# FAISS when SIMILAR_TEXTS_BACKEND is "numba".
+# Numba is optional, so EmbeddingService only imports this module on that path.
+
+# fastmath=True would include "ninf"/"nnan", letting LLVM assume no value is ever
+# infinite; the heaps below are seeded with -inf, so keep only the reordering flags
+_FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+# float32 value of every float16 bit pattern; 256 KB, so it stays cache-resident
+_HALF_TO_FLOAT = np.arange(1 << 16, dtype=np.uint16).view(np.float16).astype(np.float32)
+
+@njit(inline="always")
+def _heap_replace_min(scores, indices, score, index):
+    """Replace the root of a min-heap of size len(scores) and restore the heap order"""
+    k = scores.shape[0]
+    pos = 0
+    while True:
+        child = 2 * pos + 1
+        if child >= k:
+            break
+        if child + 1 < k and scores[child + 1] < scores[child]:
+            child += 1
+        if scores[child] >= score:
+            break
+        scores[pos] = scores[child]
+        indices[pos] = indices[child]
+        pos = child
+    scores[pos] = score
+    indices[pos] = index
+
+@njit(cache=True)
+def _merge_heaps(heap_scores, heap_indices, k):
+    """Best k of the per-thread heaps, best first"""
+    # Every block holds at most k real hits, so the best k overall are among them;
+    # unfilled -inf/-1 slots sort last
+    merged_scores = heap_scores.ravel()
+    order = np.argsort(-merged_scores)[:k]
+    return heap_indices.ravel()[order], merged_scores[order]
+
+def _block_count(n):
+    """One block per Numba thread, but never more blocks than rows"""
+    # Read here rather than inside the kernels: a kernel that calls get_num_threads()
+    # uses dynamic globals and Numba refuses to cache it
+    return max(1, min(numba.get_num_threads(), n))
+
+@njit(parallel=True, fastmath=_FASTMATH, cache=True)
+def _topk_dot(corpus, q, k, blocks):
+    n, dim = corpus.shape
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    
+    block_size = (n + blocks - 1) // blocks
+    heap_scores = np.full((blocks, k), -np.inf, dtype=np.float32)
+    heap_indices = np.full((blocks, k), -1, dtype=np.int64)
+    
+    for block in prange(blocks):
+        scores = heap_scores[block]
+        indices = heap_indices[block]
+        for row in range(block * block_size, min((block + 1) * block_size, n)):
+            score = np.float32(0.0)
+            for j in range(dim):
+                score += corpus[row, j] * q[j]
+            if score > scores[0]:
+                _heap_replace_min(scores, indices, score, row)
+    
+    return _merge_heaps(heap_scores, heap_indices, k)
+
+def topk_dot(corpus, q, k):
+    """Indices and scores of the k corpus rows with the largest dot product with q, best first
+    
+    Rows are split into one block per thread; each thread keeps its own k-sized
+    min-heap while it scans, and the per-thread heaps are merged at the end.
+    """
+    return _topk_dot(corpus, np.ascontiguousarray(q, dtype=np.float32), k, _block_count(len(corpus)))
+
+@njit(parallel=True, fastmath=_FASTMATH, cache=True)
+def _fused_topk(corpus_bits, q, k, blocks, half_to_float):
+    n, dim = corpus_bits.shape
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    
+    block_size = (n + blocks - 1) // blocks
+    heap_scores = np.full((blocks, k), -np.inf, dtype=np.float32)
+    heap_indices = np.full((blocks, k), -1, dtype=np.int64)
+    
+    for block in prange(blocks):
+        scores = heap_scores[block]
+        indices = heap_indices[block]
+        for row in range(block * block_size, min((block + 1) * block_size, n)):
+            score = np.float32(0.0)
+            for j in range(dim):
+                score += half_to_float[corpus_bits[row, j]] * q[j]
+            if score > scores[0]:
+                _heap_replace_min(scores, indices, score, row)
+    
+    return _merge_heaps(heap_scores, heap_indices, k)
+
+def topk_dot_f16(corpus, q, k):
+    """topk_dot for a C-contiguous float16 corpus
+    
+    The corpus goes to the kernel as its raw uint16 bits and each element is widened
+    to float32 inside the dot product through a lookup table, so the corpus is read
+    once and never materialized as float32.
+    """
+    return _fused_topk(
+        corpus.view(np.uint16),
+        np.ascontiguousarray(q, dtype=np.float32),
+        k,
+        _block_count(len(corpus)),
+        _HALF_TO_FLOAT
+    )
\ No newline at end of file
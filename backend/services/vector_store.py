@@ -5,13 +5,13 @@ import json
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
 import logging
-from utils import config
+from utils.config import config
 
 logger = logging.getLogger(__name__)
 
 class VectorStore:
-    def __init__(self, dimension: int = None):
-        self.index_path = Path(config.config.VECTOR_STORE_PATH)
+    def __init__(self, dimension: int = None, embedding_id: str = None):
+        self.index_path = Path(config.VECTOR_STORE_PATH)
         self.index_file = self.index_path / "faiss_index.bin"
         self.metadata_file = self.index_path / "metadata.pkl"
         self.config_file = self.index_path / "config.json"
@@ -19,6 +19,8 @@ class VectorStore:
         self.index = None
         self.metadata = []
         self.dimension = dimension
+        # Which embedding model/backend the vectors come from, recorded in config.json
+        self.embedding_id = embedding_id
         
         # Ensure directory exists
         self.index_path.mkdir(parents=True, exist_ok=True)
@@ -54,6 +56,7 @@ class VectorStore:
             config_data = {
                 "dimension": dimension,
                 "index_type": "IndexFlatL2",
+                "embedding_model": self.embedding_id,
                 "created_at": str(Path().resolve())
             }
             
@@ -80,11 +83,27 @@ class VectorStore:
                 with open(self.config_file, 'r') as f:
                     config_data = json.load(f)
                     self.dimension = config_data.get("dimension")
+                    self._check_embedding_model(config_data.get("embedding_model"))
             
         except Exception as e:
             logger.error(f"Error loading index: {e}")
             raise
     
+    def _check_embedding_model(self, stored_id: Optional[str]):
+        """Warn when the saved vectors come from a different model than the one encoding queries"""
+        if self.embedding_id is None or stored_id == self.embedding_id:
+            return
+        if stored_id is None:
+            # Indexes from before backends were recorded were built with the torch model
+            if self.embedding_id.endswith("(torch)"):
+                return
+            stored_id = "an unrecorded model (torch, from an older version)"
+        logger.warning(
+            f"Vector store was built with {stored_id} but queries are encoded with {self.embedding_id}; "
+            "search results will be unreliable until the documents are re-indexed "
+            "(clear the vector store and upload them again)"
+        )
+    
     def _save_index(self):
         """Save FAISS index and metadata to disk"""
         try:
@@ -121,7 +140,8 @@ class VectorStore:
                 del metadata["embedding"]
                 chunk_metadata.append(metadata)
             
-            embeddings = np.array(embeddings).astype(np.float32)
+            # Convert straight to float32 rather than building an intermediate array first
+            embeddings = np.array(embeddings, dtype=np.float32)
             
             # Create index if it doesn't exist
             if self.index is None:
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The backend imports its packages as top-level modules (services, utils), as when run from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,13 @@
+import pytest
+
+from utils.config import Config
+
+def test_from_env_reads_similar_texts_backend(monkeypatch):
+    monkeypatch.setenv("SIMILAR_TEXTS_BACKEND", "numba")
+    assert Config.from_env().SIMILAR_TEXTS_BACKEND == "numba"
+
+@pytest.mark.parametrize("value", ["Numba", "numpy", ""])
+def test_from_env_rejects_unknown_similar_texts_backend(monkeypatch, value):
+    monkeypatch.setenv("SIMILAR_TEXTS_BACKEND", value)
+    with pytest.raises(ValueError, match="SIMILAR_TEXTS_BACKEND"):
+        Config.from_env()
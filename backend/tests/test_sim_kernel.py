@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("numba")
+
+from services.sim_kernel import _HALF_TO_FLOAT, _block_count, _fused_topk, _topk_dot, topk_dot, topk_dot_f16
+
+def _expected(scores, k):
+    """Reference selection: indices of the k highest scores, best first"""
+    return np.argsort(-scores)[:k]
+
+# blocks * k > n leaves unfilled slots in some heaps
+CASES = [(10000, 5, _block_count(10000)), (10, 5, 4), (3, 5, 2), (7, 7, 3)]
+
+@pytest.mark.parametrize("n, k, blocks", CASES)
+def test_topk_dot_matches_full_sort(n, k, blocks):
+    rng = np.random.default_rng(0)
+    corpus = rng.standard_normal((n, 32)).astype(np.float32)
+    q = rng.standard_normal(32).astype(np.float32)
+    scores = corpus @ q
+    expected = _expected(scores, k)
+
+    indices, found = _topk_dot(corpus, q, k, blocks)
+    assert np.array_equal(indices, expected)
+    assert np.allclose(found, scores[expected], atol=1e-4)
+
+@pytest.mark.parametrize("n, k, blocks", CASES)
+def test_fused_f16_matches_full_sort(n, k, blocks):
+    rng = np.random.default_rng(1)
+    corpus = rng.standard_normal((n, 32)).astype(np.float16)
+    q = rng.standard_normal(32).astype(np.float32)
+    scores = corpus.astype(np.float32) @ q
+    expected = _expected(scores, k)
+
+    indices, found = _fused_topk(corpus.view(np.uint16), q, k, blocks, _HALF_TO_FLOAT)
+    assert np.array_equal(indices, expected)
+    assert np.allclose(found, scores[expected], atol=1e-3)
+
+def test_half_to_float_table_covers_every_finite_half():
+    bits = np.arange(1 << 16, dtype=np.uint16)
+    halves = bits.view(np.float16)
+    finite = np.isfinite(halves)
+    assert np.array_equal(_HALF_TO_FLOAT[finite], halves[finite].astype(np.float32))
+
+def test_public_wrappers_pick_their_own_block_count():
+    rng = np.random.default_rng(2)
+    corpus = rng.standard_normal((500, 16)).astype(np.float32)
+    q = rng.standard_normal(16)
+    expected = _expected(corpus @ q.astype(np.float32), 3)
+
+    assert np.array_equal(topk_dot(corpus, q, 3)[0], expected)
+
+    corpus_f16 = corpus.astype(np.float16)
+    expected = _expected(corpus_f16.astype(np.float32) @ q.astype(np.float32), 3)
+    assert np.array_equal(topk_dot_f16(corpus_f16, q, 3)[0], expected)
+
+def test_k_zero_returns_empty():
+    corpus = np.ones((4, 8), dtype=np.float32)
+    indices, scores = _topk_dot(corpus, np.ones(8, dtype=np.float32), 0, 2)
+    assert len(indices) == 0 and len(scores) == 0
@@ -1,52 +1,84 @@
 import os
+from dataclasses import dataclass, fields
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
-import os
-
-load_dotenv()  # This loads variables from the .env file into the environment
 
+SIMILAR_TEXTS_BACKENDS = ("faiss", "numba")
 
-# Load environment variables
-
+@dataclass(frozen=True, slots=True)
 class Config:
     # Ollama Configuration
-    OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11433")
-    OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+    OLLAMA_HOST: str = "http://localhost:11433"
+    OLLAMA_MODEL: str = "llama3"
     
     # Application Configuration
-    APP_HOST = os.getenv("APP_HOST", "127.0.0.1")
-    APP_PORT = int(os.getenv("APP_PORT", 8000))
-    DEBUG = os.getenv("DEBUG", "True").lower() == "true"
+    APP_HOST: str = "127.0.0.1"
+    APP_PORT: int = 8000
+    DEBUG: bool = True
     
     # Vector Store Configuration
-    VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "./data/vector_store")
-    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 256))
-    print("CHUNK_SIZE =", CHUNK_SIZE)
-
-    CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 200))
+    VECTOR_STORE_PATH: str = "./data/vector_store"
+    CHUNK_SIZE: int = 256
+    CHUNK_OVERLAP: int = 200
     
     # Embedding Configuration
-    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-    EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    EMBEDDING_DEVICE: str = "cpu"
+    EMBEDDING_BACKEND: str = "torch"  # torch | onnx | openvino; changing it requires re-indexing
+    EMBEDDING_ONNX_FILE: str = "onnx/model_qint8_avx512_vnni.onnx"
+    EMBED_BATCH_SIZE: int = 64
+    TORCH_NUM_THREADS: int = 0  # 0 uses every CPU; torch backend only
+    EMBEDDING_PRELOAD: bool = True  # load the model at startup rather than on the first request
     
     # Upload Configuration
-    UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./backend/uploads")
-    MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", 10485760))  # 10MB
+    UPLOAD_DIR: str = "./backend/uploads"
+    MAX_FILE_SIZE: int = 10485760  # 10MB
     
     # Retrieval Configuration
-    TOP_K_RESULTS = int(os.getenv("TOP_K_RESULTS", 5))
-    SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", 0.7))
+    TOP_K_RESULTS: int = 5
+    # faiss | numba; only EmbeddingService.find_similar_texts*, VectorStore.search always uses FAISS
+    SIMILAR_TEXTS_BACKEND: str = "faiss"
+    SIMILARITY_THRESHOLD: float = 0.7
     
     @classmethod
-    def ensure_directories(cls):
+    def from_env(cls) -> "Config":
+        """Build the configuration from environment variables named after the fields, after loading .env"""
+        load_dotenv()
+        values = {}
+        for field in fields(cls):
+            raw = os.getenv(field.name)
+            if raw is None:
+                continue
+            if field.type is bool:
+                values[field.name] = raw.lower() == "true"
+            else:
+                values[field.name] = field.type(raw)
+        
+        backend = values.get("SIMILAR_TEXTS_BACKEND")
+        if backend is not None and backend not in SIMILAR_TEXTS_BACKENDS:
+            raise ValueError(
+                f"SIMILAR_TEXTS_BACKEND must be one of {', '.join(SIMILAR_TEXTS_BACKENDS)}, got {backend!r}"
+            )
+        return cls(**values)
+    
+    def ensure_directories(self):
         """Ensure all required directories exist"""
         directories = [
-            cls.VECTOR_STORE_PATH,
-            cls.UPLOAD_DIR
+            self.VECTOR_STORE_PATH,
+            self.UPLOAD_DIR
         ]
         for directory in directories:
             Path(directory).mkdir(parents=True, exist_ok=True)
 
+@lru_cache(maxsize=None)
+def get_config() -> Config:
+    """The process-wide configuration instance"""
+    return Config.from_env()
+
+def init_app():
+    """One-time setup that touches the filesystem; called from the app's startup"""
+    get_config().ensure_directories()
+
 # Initialize configuration
-config = Config()
-config.ensure_directories()
\ No newline at end of file
+config = get_config()
\ No newline at end of file
@@ -1,10 +1,16 @@
 import streamlit as st
-import requests
-import json
+from websockets.sync.client import connect as ws_connect
+from websockets.exceptions import ConnectionClosed, WebSocketException
+import orjson
 from pathlib import Path
-import time
-import pandas as pd
-from datetime import datetime
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+
+# Local imports
+from virtual_chat import virtual_chat
 
 # Page configuration
 st.set_page_config(
@@ -14,631 +20,356 @@ st.set_page_config(
     initial_sidebar_state="expanded"  # Start with sidebar opened
 )
 
+# Number of most recent messages rendered, grown by "Load earlier messages"
+CHAT_WINDOW_SIZE = 50
+
+# Past this many messages the history is shown in a virtualized scroll view
+VIRTUAL_SCROLL_THRESHOLD = 200
+VIRTUAL_SCROLL_HEIGHT = 600
+
 # Initialize session state
 if "messages" not in st.session_state:
     st.session_state.messages = []
-if "chat_input_key" not in st.session_state:
-    st.session_state.chat_input_key = 0
+if "window_size" not in st.session_state:
+    st.session_state.window_size = CHAT_WINDOW_SIZE
 
 # API configuration
 API_BASE_URL = "http://127.0.0.1:8000"
+WS_QUERY_URL = "ws://127.0.0.1:8000/ws/query"
+
+# Page stylesheet, inlined into the page (Streamlit serves static .css as text/plain)
+STYLESHEET = Path(__file__).parent / "static" / "style.css"
+
+# Source text and file names are inserted into raw HTML, so escape them first
+_HTML_ESCAPE = str.maketrans({
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;",
+    "\"": "&quot;",
+    "'": "&#39;"
+})
+
+_SOURCE_TEMPLATE = """
+<details class="source">
+    <summary>🔍 <b>Source {index}:</b> {file_name} | Relevance: {score:.1%}</summary>
+    <div class="source-container">
+        <div class="source-header">📄 Document Section #{chunk_id}</div>
+        <div style="line-height: 1.6;">
+            {text}
+        </div>
+    </div>
+</details>
+"""
 
-# Enhanced CSS with blue theme and better UX
-st.markdown("""
-<style>
-@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-
-/* Global styling */
-* {
-    font-family: 'Inter', sans-serif;
-}
-
-.stApp {
-    background-color: #2E5090;
-}
-
-/* Main chat interface styling */
-.main-container {
-    max-width: 400px;
-    margin: 0 auto;
-    background: white;
-    border-radius: 20px;
-    box-shadow: 0 10px 25px rgba(0, 0, 0, 0.1);
-    margin-top: 2rem;
-    margin-bottom: 2rem;
-}
-.sidebar-card {
-    display: none;
-}
-/* Chat message styling */
-.user-message {
-    background: linear-gradient(135deg, #1976D2 0%, #0D47A1 100%);
-    color: white;
-    padding: 1.2rem 1.8rem;
-    border-radius: 20px 20px 5px 20px;
-    margin: 1rem 0;
-    # margin-left: 15%;
-    # margin-right: 15%;
-    position: relative;
-    box-shadow: 0 4px 15px rgba(25, 118, 210, 0.3);
-    animation: slideInRight 0.3s ease-out;
-}
-
-.assistant-message {
-    background: linear-gradient(135deg, #E3F2FD 0%, #BBDEFB 100%);
-    color: #333;
-    padding: 1.2rem 1.8rem;
-    border-radius: 20px 20px 20px 5px;
-    margin: 1rem 0;
-    # margin-right: 15%;
-    # margin-left: 15%;
-    position: relative;
-    box-shadow: 0 4px 15px rgba(33, 150, 243, 0.2);
-    animation: slideInLeft 0.3s ease-out;
-    border: 1px solid #BBDEFB;
-}
-
-@keyframes slideInRight {
-    from { transform: translateX(50px); opacity: 0; }
-    to { transform: translateX(0); opacity: 1; }
-}
-
-@keyframes slideInLeft {
-    from { transform: translateX(-50px); opacity: 0; }
-    to { transform: translateX(0); opacity: 1; }
-}
-
-/* Avatar styling */
-.user-avatar {
-    width: 40px;
-    height: 40px;
-    background: linear-gradient(135deg, #1976D2, #0D47A1);
-    border-radius: 50%;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    color: white;
-    font-weight: bold;
-    position: absolute;
-    right: -50px;
-    top: 10px;
-    box-shadow: 0 4px 12px rgba(0, 0, 0, 0.2);
-    font-size: 16px;
-}
-
-.assistant-avatar {
-    width: 40px;
-    height: 40px;
-    background: linear-gradient(135deg, #2196F3, #1976D2);
-    border-radius: 50%;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    color: white;
-    font-weight: bold;
-    position: absolute;
-    left: -50px;
-    top: 10px;
-    box-shadow: 0 4px 12px rgba(0, 0, 0, 0.2);
-    font-size: 18px;
-}
-
-/* Sidebar styling with light blue background */
-.css-1d391kg, [data-testid="stSidebar"] {
-    background: ##282C35;
-}
-
-.css-1d391kg .css-1v0mbdj, [data-testid="stSidebar"] > div {
-    background: ##282C35 !important;
-}
-
-/* Sidebar text styling - all white */
-[data-testid="stSidebar"] h1,
-[data-testid="stSidebar"] h2,
-[data-testid="stSidebar"] h3,
-[data-testid="stSidebar"] h4,
-[data-testid="stSidebar"] h5,
-[data-testid="stSidebar"] h6,
-[data-testid="stSidebar"] p,
-[data-testid="stSidebar"] .stMarkdown,
-[data-testid="stSidebar"] .stMarkdown div,
-[data-testid="stSidebar"] .stMarkdown p,
-[data-testid="stSidebar"] .stText,
-[data-testid="stSidebar"] .stCaption,
-[data-testid="stSidebar"] label {
-    color: white !important;
-}
-
-/* Sidebar metric styling */
-[data-testid="stSidebar"] [data-testid="stMetric"] {
-    background: rgba(255, 255, 255, 0.2) !important;
-    border: 1px solid rgba(255, 255, 255, 0.3) !important;
-    backdrop-filter: blur(10px);
-}
-
-[data-testid="stSidebar"] [data-testid="stMetricLabel"],
-[data-testid="stSidebar"] [data-testid="stMetricValue"] {
-    color: white !important;
-}
-
-/* Individual cards for sidebar sections */
-.sidebar-card {
-    background: rgba(255, 255, 255, 0.15);
-    border-radius: 15px;
-    padding: 1.5rem;
-    margin: 1rem 0;
-    border: 1px solid rgba(255, 255, 255, 0.2);
-    backdrop-filter: blur(10px);
-    box-shadow: 0 4px 20px rgba(0, 0, 0, 0.1);
-}
-
-.sidebar-header {
-    background: linear-gradient(135deg, #0D47A1 0%, #1976D2 100%);
-    padding: 1.5rem;
-    margin: -1rem -1rem 1rem -1rem;
-    border-radius: 15px;
-    text-align: center;
-    box-shadow: 0 4px 15px rgba(13, 71, 161, 0.3);
-}
-
-.sidebar-title {
-    color: white !important;
-    font-size: 1.5rem;
-    font-weight: 700;
-    margin: 0;
-}
-
-.sidebar-subtitle {
-    color: rgba(255, 255, 255, 0.9) !important;
-    font-size: 0.9rem;
-    margin: 0.5rem 0 0 0;
-}
-
-/* Status styling */
-.status-healthy {
-    background: linear-gradient(135deg, #4CAF50, #45a049);
-    border: none;
-    color: white !important;
-    padding: 0.8rem;
-    border-radius: 12px;
-    text-align: center;
-    margin: 0.5rem 0;
-    box-shadow: 0 4px 15px rgba(76, 175, 80, 0.3);
-    font-weight: 500;
-}
-
-.status-unhealthy {
-    background: linear-gradient(135deg, #f44336, #d32f2f);
-    border: none;
-    color: white !important;
-    padding: 0.8rem;
-    border-radius: 12px;
-    text-align: center;
-    margin: 0.5rem 0;
-    box-shadow: 0 4px 15px rgba(244, 67, 54, 0.3);
-    font-weight: 500;
-}
-
-/* Sidebar buttons styling */
-[data-testid="stSidebar"] .stButton > button {
-    background: linear-gradient(135deg, #1976D2 0%, #0D47A1 100%) !important;
-    color: white !important;
-    border: none !important;
-    border-radius: 12px !important;
-    padding: 0.5rem 1rem !important;
-    font-weight: 600 !important;
-    box-shadow: 0 4px 15px rgba(25, 118, 210, 0.3) !important;
-    transition: all 0.3s ease !important;
-}
-
-[data-testid="stSidebar"] .stButton > button:hover {
-    background: linear-gradient(135deg, #0D47A1 0%, #1976D2 100%) !important;
-    transform: translateY(-2px) !important;
-    box-shadow: 0 6px 20px rgba(25, 118, 210, 0.4) !important;
-}
-
-/* File uploader in sidebar */
-[data-testid="stSidebar"] .stFileUploader > div {
-    border: 2px dashed rgba(255, 255, 255, 0.5) !important;
-    border-radius: 15px;
-    padding: 1.5rem;
-    background: rgba(255, 255, 255, 0.1);
-    transition: all 0.3s ease;
-}
-
-[data-testid="stSidebar"] .stFileUploader > div:hover {
-    border-color: rgba(255, 255, 255, 0.8) !important;
-    background: rgba(255, 255, 255, 0.15);
-}
-
-[data-testid="stSidebar"] .stFileUploader label {
-    color: white !important;
-}
-
-/* Sidebar slider styling */
-[data-testid="stSidebar"] .stSlider > div > div > div > div {
-    background-color: white !important;
-}
-
-[data-testid="stSidebar"] .stSlider > div > div > div > div > div {
-    background-color: #282C35 !important;
-}
-
-/* Sidebar checkbox styling */
-[data-testid="stSidebar"] .stCheckbox > label > div[data-testid="stWidgetLabel"] {
-    color: white !important;
-}
-
-/* Source styling */
-.source-container {
-    background: #E3F2FD;
-    border-left: 4px solid #1976D2;
-    padding: 1.2rem;
-    margin: 1rem 0;
-    border-radius: 0 12px 12px 0;
-    box-shadow: 0 2px 10px rgba(25, 118, 210, 0.1);
-    transition: transform 0.2s ease;
-    color: #333;
-}
-
-.source-container:hover {
-    transform: translateY(-2px);
-    box-shadow: 0 4px 20px rgba(25, 118, 210, 0.2);
-}
-
-.source-header {
-    font-weight: 600;
-    color: #1976D2;
-    margin-bottom: 0.8rem;
-    font-size: 0.95rem;
-}
-
-/* Welcome message */
-.welcome-container {
-    text-align: center;
-    padding: 4rem 2rem;
-    background: white;
-    border-radius: 20px;
-    color: #333;
-    margin: 2rem 0;
-    box-shadow: 0 15px 35px rgba(25, 118, 210, 0.1);
-}
-
-.welcome-title {
-    font-size: 2.5rem;
-    font-weight: 700;
-    margin-bottom: 1rem;
-    color: #1976D2;
-}
-
-.welcome-subtitle {
-    font-size: 1.2rem;
-    margin-bottom: 0.5rem;
-    color: #666;
-}
-
-.welcome-description {
-    font-size: 1rem;
-    color: #666;
-    max-width: 600px;
-    margin: 0 auto;
-    line-height: 1.6;
-}
-
-/* Input styling with 15% margin */
-.stTextInput > div > div > input {
-    border-radius: 25px;
-    border: 2px solid #1976D2;
-    padding: 1rem 1.5rem;
-    font-size: 1rem;
-    background: white;
-    color: #333;
-    box-shadow: 0 4px 15px rgba(25, 118, 210, 0.1);
-    transition: all 0.3s ease;
-    height: 80px;
-}
-
-.stTextInput > div > div > input:focus {
-    border-color: #0D47A1;
-    box-shadow: 0 4px 20px rgba(13, 71, 161, 0.2);
-}
-
-.stTextInput > div > div > input::placeholder {
-    color: #999;
-}
-
-/* Button styling */
-.stButton > button {
-    border-radius: 25px;
-    border: none;
-    padding: 0.8rem 2rem;
-    font-weight: 600;
-    transition: all 0.3s ease;
-    box-shadow: 0 4px 15px rgba(0, 0, 0, 0.1);
-    color: white;
-}
-
-.stButton > button[kind="primary"] {
-    background: linear-gradient(135deg, #1976D2 0%, #0D47A1 100%);
-}
-
-.stButton > button[kind="primary"]:hover {
-    transform: translateY(-2px);
-    box-shadow: 0 6px 20px rgba(25, 118, 210, 0.4);
-    background: linear-gradient(135deg, #0D47A1 0%, #1976D2 100%);
-}
-
-.stButton > button[kind="secondary"] {
-    background: linear-gradient(135deg, #E3F2FD 0%, #BBDEFB 100%);
-    color: #1976D2;
-}
-
-.stButton > button[kind="secondary"]:hover {
-    transform: translateY(-2px);
-    box-shadow: 0 6px 20px rgba(187, 222, 251, 0.4);
-}
-
-/* Metrics styling */
-[data-testid="stMetric"] {
-    background: white;
-    padding: 1rem;
-    border-radius: 12px;
-    border: 1px solid #E3F2FD;
-    margin: 0.5rem 0;
-    box-shadow: 0 4px 15px rgba(25, 118, 210, 0.1);
-}
-
-[data-testid="stMetricLabel"] {
-    color: #1976D2;
-}
-
-[data-testid="stMetricValue"] {
-    color: #333;
-}
-
-/* Hide default streamlit elements */
-.stDeployButton {
-    visibility: hidden;
-}
-
-#MainMenu {
-    visibility: hidden;
-}
-
-footer {
-    visibility: hidden;
-}
-
-header {
-    visibility: hidden;
-}
-
-/* Loading animation */
-.stSpinner {
-    text-align: center;
-}
-
-.stSpinner > div {
-    color: #1976D2;
-}
-
-/* Sidebar expander styling */
-[data-testid="stSidebar"] .streamlit-expanderHeader {
-    background: rgba(255, 255, 255, 0.2) !important;
-    border: 1px solid rgba(255, 255, 255, 0.3) !important;
-    border-radius: 10px !important;
-    color: white !important;
-    font-weight: 600 !important;
-    backdrop-filter: blur(10px);
-}
-
-[data-testid="stSidebar"] .streamlit-expanderHeader:hover {
-    background: rgba(255, 255, 255, 0.25) !important;
-}
-
-[data-testid="stSidebar"] .streamlit-expanderContent {
-    background: rgba(255, 255, 255, 0.1) !important;
-    border-radius: 0 0 10px 10px !important;
-    border: 1px solid rgba(255, 255, 255, 0.2) !important;
-    border-top: none !important;
-}
-
-/* Expander styling */
-.streamlit-expanderHeader {
-    background: rgba(25, 118, 210, 0.1);
-    border-radius: 10px;
-    border: 1px solid rgba(25, 118, 210, 0.2);
-    color: #1976D2;
-    font-weight: 600;
-}
-
-.streamlit-expanderContent {
-    background: white;
-    border-radius: 0 0 10px 10px;
-}
-
-/* Scrollbar styling */
-::-webkit-scrollbar {
-    width: 8px;
-}
-
-::-webkit-scrollbar-track {
-    background: rgba(0, 0, 0, 0.1);
-    border-radius: 10px;
-}
-
-::-webkit-scrollbar-thumb {
-    background: linear-gradient(135deg, #1976D2, #0D47A1);
-    border-radius: 10px;
-}
-
-::-webkit-scrollbar-thumb:hover {
-    background: linear-gradient(135deg, #0D47A1, #1976D2);
-}
-
-/* Chat input container with 15% margins */
-.chat-input-container {
-    position: fixed;
-    bottom: 0;
-    left: 15%;
-    right: 15%;
-    background: white;
-    padding: 1rem;
-    box-shadow: 0 -5px 15px rgba(0, 0, 0, 0.1);
-    z-index: 999;
-    border-radius: 20px 20px 0 0;
-    display: none;
-}
-
-/* Example questions */
-.example-questions {
-    display: flex;
-    gap: 0.5rem;
-    margin-top: 1rem;
-    flex-wrap: wrap;
-}
-
-.example-question {
-    background: #E3F2FD;
-    color: #1976D2;
-    padding: 0.5rem 1rem;
-    border-radius: 20px;
-    font-size: 0.9rem;
-    cursor: pointer;
-    transition: all 0.3s ease;
-    border: 1px solid #BBDEFB;
-}
-
-.example-question:hover {
-    background: #BBDEFB;
-    transform: translateY(-2px);
-}
-
-/* Sidebar toggle button */
-.sidebar-toggle {
-    position: fixed;
-    top: 1rem;
-    left: 1rem;
-    z-index: 1000;
-    background: linear-gradient(135deg, #1976D2 0%, #0D47A1 100%);
-    border: none;
-    border-radius: 50%;
-    width: 50px;
-    height: 50px;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    color: white;
-    font-size: 1.2rem;
-    cursor: pointer;
-    box-shadow: 0 4px 15px rgba(25, 118, 210, 0.3);
-    transition: all 0.3s ease;
-}
-
-.sidebar-toggle:hover {
-    transform: scale(1.1);
-    box-shadow: 0 6px 20px rgba(25, 118, 210, 0.4);
-}
-</style>
-""", unsafe_allow_html=True)
+@st.cache_resource
+def stylesheet_html():
+    """Inline <style> block for the page stylesheet
+    
+    Read once per process; restart the app after editing the stylesheet.
+    """
+    return f"<style>\n{STYLESHEET.read_text(encoding='utf-8')}\n</style>"
+
+@st.cache_resource
+def get_session():
+    """Pooled HTTP session shared across reruns and sessions; idempotent calls retry transient failures with backoff"""
+    # requests is imported on first use to keep it off the script's cold-start path
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    retry = Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "DELETE"]),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def get_fetch_executor():
+    """Worker pool for the sidebar's independent API reads"""
+    return ThreadPoolExecutor(max_workers=4)
+
+def submit_in_script_context(executor, fn, *args):
+    """Run fn on the executor with the current script run attached, so st.cache_data works on the worker"""
+    ctx = get_script_run_ctx()
+    
+    def run():
+        thread = threading.current_thread()
+        add_script_run_ctx(thread, ctx)
+        try:
+            return fn(*args)
+        finally:
+            # add_script_run_ctx(thread, None) would keep the current context, so remove it
+            # to stop the pooled thread holding this session alive
+            if hasattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME):
+                delattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME)
+    
+    return executor.submit(run)
 
+@st.cache_data(ttl=10, show_spinner=False)
 def check_api_health():
     """Check if the API is running and healthy"""
+    import requests
+    
     try:
-        response = requests.get(f"{API_BASE_URL}/health", timeout=5)
+        response = get_session().get(f"{API_BASE_URL}/health", timeout=5)
         if response.status_code == 200:
-            return True, response.json()
+            return True, orjson.loads(response.content)
         else:
             return False, {"error": f"API returned status {response.status_code}"}
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         return False, {"error": str(e)}
 
 def upload_file(file):
     """Upload a file to the API"""
+    import requests
+    
     try:
-        files = {"file": (file.name, file.getvalue(), file.type)}
-        response = requests.post(f"{API_BASE_URL}/upload", files=files, timeout=30)
+        # A memoryview over the upload buffer goes into the multipart body without an extra copy
+        files = {"file": (file.name, file.getbuffer(), file.type)}
+        response = get_session().post(f"{API_BASE_URL}/upload", files=files, timeout=30)
         
         if response.status_code == 200:
-            return True, response.json()
+            return True, orjson.loads(response.content)
         else:
             return False, {"error": f"Upload failed with status {response.status_code}"}
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         return False, {"error": str(e)}
 
-def query_documents(question, top_k=5):
-    """Query the document collection"""
-    try:
-        data = {"question": question, "top_k": top_k}
-        response = requests.post(
-            f"{API_BASE_URL}/query", 
-            json=data,
-            headers={"Content-Type": "application/json"},
-            timeout=60
-        )
-        
-        if response.status_code == 200:
-            return True, response.json()
-        else:
-            return False, {"error": f"Query failed with status {response.status_code}"}
-    except requests.exceptions.RequestException as e:
-        return False, {"error": str(e)}
+@st.cache_resource
+def get_query_executor():
+    """Worker pool shared by all sessions for /query calls"""
+    return ThreadPoolExecutor(max_workers=4)
+
+@st.cache_resource
+def get_inflight_queries():
+    """Registry of in-flight /query calls keyed by (question, top_k)"""
+    # Reentrant: add_done_callback runs forget() at once, under the lock, if the query already finished
+    return {}, threading.RLock()
 
+def query_documents(question, top_k=5, on_token=None):
+    """Query the document collection, sharing the result of an identical in-flight query
+    
+    If this call starts the query, on_token is called with each answer token as
+    it streams in. Calls that join an in-flight query only get the final result.
+    """
+    inflight, lock = get_inflight_queries()
+    key = (question, top_k)
+    tokens = None
+    
+    with lock:
+        future = inflight.get(key)
+        if future is None or future.done():
+            tokens = queue.Queue()
+            future = get_query_executor().submit(_ws_query, question, top_k, tokens)
+            inflight[key] = future
+            
+            def forget(done_future):
+                # Only drop the entry if a newer call hasn't replaced it
+                with lock:
+                    if inflight.get(key) is done_future:
+                        del inflight[key]
+            
+            future.add_done_callback(forget)
+    
+    if tokens is not None:
+        # Relay tokens from the worker to the script thread, where Streamlit calls are allowed
+        for token in iter(tokens.get, None):
+            if on_token:
+                on_token(token)
+    
+    return future.result()
+
+@st.cache_resource
+def get_query_connections():
+    """WebSocket connections to /ws/query, one per query worker thread, kept open across turns"""
+    return threading.local()
+
+def _drop_connection(connections):
+    """Close and forget the worker thread's WebSocket, if it has one"""
+    ws = getattr(connections, "ws", None)
+    connections.ws = None
+    if ws is not None:
+        ws.close()
+
+def _ws_query(question, top_k, tokens):
+    """Send a single query over the worker thread's persistent WebSocket
+    
+    Answer tokens are put on the tokens queue as they arrive, followed by None.
+    """
+    connections = get_query_connections()
+    payload = orjson.dumps({"question": question, "top_k": top_k}).decode()
+    
+    try:
+        for attempt in range(2):
+            reused = getattr(connections, "ws", None) is not None
+            received = False
+            try:
+                if not reused:
+                    connections.ws = ws_connect(WS_QUERY_URL, open_timeout=5)
+                ws = connections.ws
+                ws.send(payload)
+                
+                sources = []
+                while True:
+                    frame = orjson.loads(ws.recv(timeout=60))
+                    received = True
+                    if frame["type"] == "sources":
+                        sources = frame["sources"]
+                    elif frame["type"] == "token":
+                        tokens.put(frame["token"])
+                    elif frame["type"] == "answer":
+                        return True, {"answer": frame["answer"], "sources": sources, "query": frame["query"]}
+                    else:
+                        return False, {"error": frame.get("error", "Unknown error")}
+            except ConnectionClosed as e:
+                connections.ws = None
+                # A reused connection may have been dropped by the server; reconnect once
+                if reused and not received and attempt == 0:
+                    continue
+                return False, {"error": f"Connection closed: {e}"}
+            except (OSError, TimeoutError) as e:
+                _drop_connection(connections)
+                return False, {"error": str(e)}
+            except WebSocketException as e:
+                # Failed handshake (e.g. a backend without /ws/query), bad URI, protocol errors
+                _drop_connection(connections)
+                return False, {"error": f"WebSocket error: {e}"}
+            except (ValueError, KeyError) as e:
+                # Undecodable frame or one missing expected fields; the stream is out of step now
+                _drop_connection(connections)
+                return False, {"error": f"Invalid response from backend: {e!r}"}
+    finally:
+        tokens.put(None)
+
+@st.cache_data(ttl=60, show_spinner=False)
 def get_documents():
     """Get list of stored documents"""
+    import requests
+    
     try:
-        response = requests.get(f"{API_BASE_URL}/documents", timeout=10)
+        response = get_session().get(f"{API_BASE_URL}/documents", timeout=10)
         if response.status_code == 200:
-            return True, response.json()
+            return True, orjson.loads(response.content)
         else:
             return False, {"error": f"Failed to fetch documents: {response.status_code}"}
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         return False, {"error": str(e)}
 
 def delete_document(filename):
     """Delete a document"""
+    import requests
+    
     try:
-        response = requests.delete(f"{API_BASE_URL}/documents/{filename}", timeout=10)
+        response = get_session().delete(f"{API_BASE_URL}/documents/{filename}", timeout=10)
         if response.status_code == 200:
-            return True, response.json()
+            return True, orjson.loads(response.content)
         else:
             return False, {"error": f"Failed to delete document: {response.status_code}"}
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         return False, {"error": str(e)}
 
-def render_message(message, is_user=True):
-    """Render a chat message with proper styling"""
-    if is_user:
-        st.markdown(f"""
-        <div class="user-message">
-            <div class="user-avatar">👤</div>
-            {message}
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown(f"""
-        <div class="assistant-message">
-            <div class="assistant-avatar">🤖</div>
-            {message}
-        </div>
-        """, unsafe_allow_html=True)
+def render_message(message, is_user=True, sources=None, key=None):
+    """Render a chat message with the native chat component, followed by its sources if given
+    
+    Source HTML is only built once the user ticks the message's source toggle.
+    """
+    role, avatar = ("user", "👤") if is_user else ("assistant", "🤖")
+    with st.chat_message(role, avatar=avatar):
+        st.markdown(message)
+        if sources:
+            if st.checkbox(f"📚 **Source References** ({len(sources)})", key=f"src_{key}_open"):
+                st.markdown(render_sources(sources), unsafe_allow_html=True)
 
 def render_sources(sources):
-    """Render source information"""
-    if sources:
-        st.markdown("### 📚 **Source References**")
-        for i, source in enumerate(sources, 1):
-            with st.expander(f"🔍 **Source {i}:** {source.get('file_name', 'Unknown')} | Relevance: {source.get('similarity_score', 0):.1%}", expanded=False):
-                st.markdown(f"""
-                <div class="source-container">
-                    <div class="source-header">📄 Document Section #{source.get('chunk_id', 'N/A')}</div>
-                    <div style="line-height: 1.6;">
-                        {source['text']}
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+    """Render source information as collapsible HTML fragments"""
+    parts = []
+    for i, source in enumerate(sources, 1):
+        parts.append(_SOURCE_TEMPLATE.format(
+            index=i,
+            file_name=str(source.get('file_name', 'Unknown')).translate(_HTML_ESCAPE),
+            score=source.get('similarity_score', 0),
+            chunk_id=str(source.get('chunk_id', 'N/A')).translate(_HTML_ESCAPE),
+            text=source['text'].translate(_HTML_ESCAPE)
+        ))
+    return "".join(parts)
+
+def render_document_library(documents):
+    """Render stored documents as a single table widget with a delete selection column"""
+    # Keying the editor on the list contents resets the selection whenever the library changes
+    docs_hash = hash(tuple((doc["filename"], doc["chunks"]) for doc in documents))
+    rows = [
+        {"delete": False, "filename": doc["filename"], "chunks": doc["chunks"]}
+        for doc in documents
+    ]
+    edited = st.data_editor(
+        rows,
+        key=f"doc_library_{docs_hash}",
+        hide_index=True,
+        use_container_width=True,
+        disabled=["filename", "chunks"],
+        column_config={
+            "delete": st.column_config.CheckboxColumn("🗑️", help="Select documents to delete"),
+            "filename": st.column_config.TextColumn("📄 Document"),
+            "chunks": st.column_config.NumberColumn("🧩 Chunks")
+        }
+    )
+    
+    selected = [row["filename"] for row in edited if row["delete"]]
+    if st.button("🗑️ Delete selected", disabled=not selected, help="Delete the selected documents", use_container_width=True, key="delete_docs_btn"):
+        with st.spinner("Deleting..."):
+            failed = [filename for filename in selected if not delete_document(filename)[0]]
+            if len(failed) < len(selected):
+                get_documents.clear()
+            if not failed:
+                notify("Deleted!", "🗑️")
+                st.rerun()
+            else:
+                st.error(f"❌ Delete failed: {', '.join(failed)}")
+
+def notify(message, icon):
+    """Queue a toast for the next run, so it isn't lost to the st.rerun() that follows"""
+    st.session_state.toast = (message, icon)
+
+@st.fragment
+def settings_panel():
+    """Assistant settings, kept in st.session_state under the widget keys; widget changes rerun only this panel"""
+    st.slider("🔍 Sources per response", 1, 10, 5, key="top_k", help="Number of document sources to reference")
+    st.checkbox("📚 Show source references", value=True, key="show_sources", help="Display document sources used in responses")
+    
+    # The transcript depends on show_sources, so only that change needs a full rerun
+    if st.session_state.show_sources != st.session_state.get("transcript_sources", st.session_state.show_sources):
+        # Record the new value first: this panel runs again before main() does on the full rerun
+        st.session_state.transcript_sources = st.session_state.show_sources
+        st.rerun()
 
 def main():
+    # Health and the document list are independent, so fetch them concurrently
+    fetch_executor = get_fetch_executor()
+    health_future = submit_in_script_context(fetch_executor, check_api_health)
+    docs_future = None
+    if st.session_state.get("show_kb", True):
+        docs_future = submit_in_script_context(fetch_executor, get_documents)
+    
+    # Without the backend nothing below is usable, so skip building the page
+    health_ok, _ = health_future.result()
+    if not health_ok:
+        st.error("🚫 Backend not accessible at http://127.0.0.1:8000")
+        st.info("💡 Please start the backend server to continue")
+        st.stop()
+    
+    st.markdown(stylesheet_html(), unsafe_allow_html=True)
+    
+    if "toast" in st.session_state:
+        message, icon = st.session_state.pop("toast")
+        st.toast(message, icon=icon)
+    
     # Sidebar for document management and system status
     with st.sidebar:
         st.markdown("""
@@ -649,93 +380,76 @@ def main():
         """, unsafe_allow_html=True)
         
         # System Status Section - Card 1
-        st.markdown('<div class="sidebar-card">', unsafe_allow_html=True)
-        st.markdown("### ⚡ System Status")
-        health_ok, health_data = check_api_health()
-        
-        if health_ok:
+        with st.container(border=True):
+            st.markdown("### ⚡ System Status")
             st.markdown('<div class="status-healthy">🟢 Connected & Ready</div>', unsafe_allow_html=True)
-        else:
-            st.markdown('<div class="status-unhealthy">🔴 Connection Failed</div>', unsafe_allow_html=True)
-            st.error("🚫 Backend not accessible at http://127.0.0.1:8000")
-            st.info("💡 Please start the backend server to continue")
-            st.markdown('</div>', unsafe_allow_html=True)
-            return
-        st.markdown('</div>', unsafe_allow_html=True)
         
         # Document Upload Section - Card 2
-        st.markdown('<div class="sidebar-card">', unsafe_allow_html=True)
-        st.markdown("### 📤 Upload Documents")
-        
-        uploaded_file = st.file_uploader(
-            "Drop your files here or browse",
-            type=['pdf', 'docx', 'txt'],
-            help="📋 Supported formats: PDF, DOCX, TXT files"
-        )
-        
-        if uploaded_file is not None:
-            st.markdown(f"**📄 {uploaded_file.name}**")
-            st.caption(f"💾 Size: {uploaded_file.size:,} bytes")
+        with st.container(border=True):
+            st.markdown("### 📤 Upload Documents")
             
-            if st.button("🚀 Upload", type="primary", use_container_width=True, key="upload_btn"):
-                with st.spinner("🔄 Processing document..."):
-                    success, result = upload_file(uploaded_file)
-                    if success:
-                        st.success("✅ Successfully uploaded!")
-                        time.sleep(1)
-                        st.rerun()
-                    else:
-                        st.error("❌ Upload failed")
-        st.markdown('</div>', unsafe_allow_html=True)
+            uploaded_file = st.file_uploader(
+                "Drop your files here or browse",
+                type=['pdf', 'docx', 'txt'],
+                help="📋 Supported formats: PDF, DOCX, TXT files"
+            )
+            
+            if uploaded_file is not None:
+                # Derive display metadata once per file instead of on every rerun
+                upload_meta = st.session_state.setdefault("upload_meta", {})
+                file_id = uploaded_file.file_id
+                if file_id not in upload_meta:
+                    upload_meta[file_id] = {
+                        "name": uploaded_file.name,
+                        "size": f"{uploaded_file.size:,}",
+                        "type": uploaded_file.type
+                    }
+                meta = upload_meta[file_id]
+                st.markdown(f"**📄 {meta['name']}**")
+                st.caption(f"💾 Size: {meta['size']} bytes")
+                
+                if st.button("🚀 Upload", type="primary", use_container_width=True, key="upload_btn"):
+                    with st.spinner("🔄 Processing document..."):
+                        success, result = upload_file(uploaded_file)
+                        if success:
+                            upload_meta.pop(file_id, None)
+                            get_documents.clear()
+                            notify("Successfully uploaded!", "✅")
+                            st.rerun()
+                        else:
+                            st.error("❌ Upload failed")
         
         # Document Management Section - Card 3
-        st.markdown('<div class="sidebar-card">', unsafe_allow_html=True)
-        st.markdown("### 📚 Knowledge Base")
-        
-        docs_ok, docs_data = get_documents()
-        if docs_ok:
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("📄 Documents", docs_data.get("total_documents", 0))
-            with col2:
-                st.metric("🧩 Text Chunks", docs_data.get("total_chunks", 0))
+        with st.container(border=True):
+            st.markdown("### 📚 Knowledge Base")
             
-            if docs_data.get("documents"):
-                with st.expander("📋 **Document Library** (Click to expand)", expanded=True):
-                    for doc in docs_data["documents"]:
-                        with st.container():
-                            col1, col2 = st.columns([4, 1])
-                            with col1:
-                                st.markdown(f"**📄 {doc['filename']}**")
-                                st.caption(f"🧩 {doc['chunks']} chunks processed")
-                            with col2:
-                                if st.button("🗑️", key=f"del_{doc['filename']}", help="Delete document", use_container_width=True):
-                                    with st.spinner("Deleting..."):
-                                        success, result = delete_document(doc['filename'])
-                                        if success:
-                                            st.success("🗑️ Deleted!")
-                                            time.sleep(1)
-                                            st.rerun()
-                                        else:
-                                            st.error("❌ Delete failed")
-                            st.markdown("---")  # Add separator between documents
-        st.markdown('</div>', unsafe_allow_html=True)
+            # The document list is only fetched while the card is shown
+            if st.checkbox("Show knowledge base", value=True, key="show_kb"):
+                docs_ok, docs_data = docs_future.result() if docs_future else get_documents()
+                if docs_ok:
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.metric("📄 Documents", docs_data.get("total_documents", 0))
+                    with col2:
+                        st.metric("🧩 Text Chunks", docs_data.get("total_chunks", 0))
+                    
+                    if docs_data.get("documents"):
+                        with st.expander("📋 **Document Library** (Click to expand)", expanded=True):
+                            render_document_library(docs_data["documents"])
         
         # Settings Section - Card 4
-        st.markdown('<div class="sidebar-card">', unsafe_allow_html=True)
-        st.markdown("### ⚙️ Assistant Settings")
-        top_k = st.slider("🔍 Sources per response", 1, 10, 5, help="Number of document sources to reference")
-        show_sources = st.checkbox("📚 Show source references", value=True, help="Display document sources used in responses")
-        
-        # Clear chat button
-        if st.button("🧹 Clear Conversation", type="secondary", help="Start a fresh conversation", use_container_width=True):
-            st.session_state.messages = []
-            st.session_state.chat_input_key += 1
-            st.success("🗑️ Conversation cleared!")
-            time.sleep(1)
-            st.rerun()
-        st.markdown('</div>', unsafe_allow_html=True)
-    
+        with st.container(border=True):
+            st.markdown("### ⚙️ Assistant Settings")
+            settings_panel()
+            
+            # Clear chat button
+            if st.button("🧹 Clear Conversation", type="secondary", help="Start a fresh conversation", use_container_width=True):
+                st.session_state.messages = []
+                st.session_state.window_size = CHAT_WINDOW_SIZE
+                st.session_state.pop("retry_question", None)
+                notify("Conversation cleared!", "🗑️")
+                st.rerun()
+
     # Main chat interface
     st.markdown('<div class="main-container">', unsafe_allow_html=True)
     
@@ -799,71 +513,88 @@ def main():
         #             st.session_state.example_question = example
         #             st.rerun()
     
-    # Display chat messages
-    for message in st.session_state.messages:
-        if message["role"] == "user":
-            render_message(message["content"], is_user=True)
-        else:
-            render_message(message["content"], is_user=False)
-            # Show sources if available
-            if show_sources and "sources" in message:
-                render_sources(message["sources"])
-    
-    st.markdown('</div>', unsafe_allow_html=True)
-    
-    # Chat input at the bottom with 15% margins
-    st.markdown('<div class="chat-input-container">', unsafe_allow_html=True)
+    show_sources = st.session_state.show_sources
+    st.session_state.transcript_sources = show_sources
+    messages = st.session_state.messages
     
-    # Handle example question if set
-    if "example_question" in st.session_state:
-        default_question = st.session_state.example_question
-        del st.session_state.example_question
+    if len(messages) > VIRTUAL_SCROLL_THRESHOLD:
+        # Very long histories go to the browser-side virtual list in one payload
+        virtual_chat(messages, show_sources, height=VIRTUAL_SCROLL_HEIGHT)
     else:
-        default_question = ""
-    
-    # Fixed input area at bottom
-    user_input = st.text_input(
-        "Message",
-        value=default_question,
-        placeholder="💬 Ask Orbitbot anything about your documents...",
-        key=f"chat_input_{st.session_state.chat_input_key}",
-        label_visibility="collapsed"
-    )
+        # Only the most recent messages are rendered; older ones load on request
+        if len(messages) > st.session_state.window_size:
+            if st.button("⬆️ Load earlier messages", type="secondary", use_container_width=True):
+                st.session_state.window_size += CHAT_WINDOW_SIZE
+                st.rerun()
+        
+        # Display chat messages
+        start = max(len(messages) - st.session_state.window_size, 0)
+        for idx in range(start, len(messages)):
+            message = messages[idx]
+            sources = message.get("sources") if show_sources else None
+            render_message(message["content"], is_user=message["role"] == "user", sources=sources, key=idx)
     
-    col1, col2 = st.columns([1, 5])
-    with col1:
-        send_button = st.button("🚀 Send", type="primary", disabled=not user_input.strip(), use_container_width=True)
+    # Live view of the turn being answered, filled in as the reply streams
+    stream_placeholder = st.empty()
     
     st.markdown('</div>', unsafe_allow_html=True)
     
+    # Queries are not retried automatically, so offer one manual retry after a failure
+    retry_button = False
+    if "retry_question" in st.session_state:
+        retry_button = st.button("🔁 Retry", type="secondary", help="Send the last question again")
+    
+    # Submits only on enter/send and clears itself, so typing doesn't rerun the app
+    user_input = st.chat_input("💬 Ask Orbitbot anything about your documents...")
+    
     # Handle user input
-    if send_button and user_input.strip():
-        # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": user_input})
+    question = None
+    sent = bool(user_input and user_input.strip())
+    if sent:
+        question = user_input.strip()
+    elif retry_button:
+        question = st.session_state.retry_question
+    
+    if question:
+        st.session_state.pop("retry_question", None)
+        
+        with stream_placeholder.container():
+            # A retried question is already shown in the transcript
+            if sent:
+                render_message(question, is_user=True)
+            with st.chat_message("assistant", avatar="🤖"):
+                answer_placeholder = st.empty()
+        partial = []
+        
+        def show_token(token):
+            partial.append(token)
+            answer_placeholder.markdown("".join(partial))
         
         # Get response from API
         with st.spinner("🧠 Orbitbot is thinking..."):
-            success, result = query_documents(user_input.strip(), top_k)
-            
-            if success:
-                # Add assistant response to chat history
-                assistant_message = {
-                    "role": "assistant", 
-                    "content": result["answer"]
-                }
-                if result.get("sources"):
-                    assistant_message["sources"] = result["sources"]
-                
-                st.session_state.messages.append(assistant_message)
-            else:
-                # Add error message
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": f"🚫 **Oops!** I encountered an issue: {result.get('error', 'Unknown error')}\n\nPlease try again or check if your documents are properly uploaded."
-                })
+            success, result = query_documents(question, st.session_state.top_k, on_token=show_token)
+        
+        if success:
+            reply = {
+                "role": "assistant", 
+                "content": result["answer"]
+            }
+            if result.get("sources"):
+                reply["sources"] = result["sources"]
+        else:
+            st.session_state.retry_question = question
+            reply = {
+                "role": "assistant", 
+                "content": f"🚫 **Oops!** I encountered an issue: {result.get('error', 'Unknown error')}\n\nPlease try again or check if your documents are properly uploaded."
+            }
+        
+        # History changes once per turn, after the reply is complete
+        if sent:
+            st.session_state.messages.extend([{"role": "user", "content": question}, reply])
+        else:
+            # The reply replaces the error message being retried
+            st.session_state.messages[-1] = reply
         
-        # Increment input key to reset the input field
-        st.session_state.chat_input_key += 1
         st.rerun()
 
 if __name__ == "__main__":
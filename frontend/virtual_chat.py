@@ -0,0 +1,201 @@
+import orjson
+import streamlit.components.v1 as components
+
+# Self-contained virtual list: only the rows inside the viewport (plus a small
+# overscan) exist in the DOM. Row offsets live in a Float64Array prefix sum
+# over measured heights, and the first visible row is found by binary search.
+_VIRTUAL_CHAT_TEMPLATE = """
+<style>
+* {
+    font-family: 'Inter', sans-serif;
+    box-sizing: border-box;
+}
+
+body {
+    margin: 0;
+}
+
+#viewport {
+    height: __HEIGHT__px;
+    overflow-y: auto;
+    position: relative;
+}
+
+#spacer {
+    position: relative;
+}
+
+.row {
+    position: absolute;
+    left: 0;
+    right: 0;
+    top: 0;
+    padding: 0.5rem 0.5rem;
+}
+
+.bubble {
+    padding: 1rem 1.5rem;
+    white-space: pre-wrap;
+    word-wrap: break-word;
+    line-height: 1.5;
+}
+
+.user .bubble {
+    background: linear-gradient(135deg, #1976D2 0%, #0D47A1 100%);
+    color: white;
+    border-radius: 20px 20px 5px 20px;
+    box-shadow: 0 4px 15px rgba(25, 118, 210, 0.3);
+}
+
+.assistant .bubble {
+    background: linear-gradient(135deg, #E3F2FD 0%, #BBDEFB 100%);
+    color: #333;
+    border-radius: 20px 20px 20px 5px;
+    border: 1px solid #BBDEFB;
+}
+
+details {
+    margin-top: 0.5rem;
+    color: #1976D2;
+}
+
+summary {
+    cursor: pointer;
+    font-size: 0.9rem;
+}
+
+.source-text {
+    background: #E3F2FD;
+    border-left: 4px solid #1976D2;
+    padding: 0.8rem;
+    margin: 0.5rem 0;
+    border-radius: 0 12px 12px 0;
+    color: #333;
+}
+</style>
+<div id="viewport"><div id="spacer"></div></div>
+<script>
+const messages = __MESSAGES__;
+const ESTIMATED_HEIGHT = 96;
+const OVERSCAN = 6;
+
+const viewport = document.getElementById("viewport");
+const spacer = document.getElementById("spacer");
+const count = messages.length;
+const heights = new Float64Array(count).fill(ESTIMATED_HEIGHT);
+const offsets = new Float64Array(count + 1);
+const rendered = new Map();
+
+function recompute(from) {
+    for (let i = from; i < count; i++) {
+        offsets[i + 1] = offsets[i] + heights[i];
+    }
+    spacer.style.height = offsets[count] + "px";
+}
+
+function rowAt(y) {
+    // Last row whose top offset is <= y
+    let lo = 0, hi = count - 1;
+    while (lo < hi) {
+        const mid = (lo + hi + 1) >> 1;
+        if (offsets[mid] <= y) lo = mid; else hi = mid - 1;
+    }
+    return lo;
+}
+
+function build(i) {
+    const message = messages[i];
+    const row = document.createElement("div");
+    row.className = "row " + message.role;
+    const bubble = document.createElement("div");
+    bubble.className = "bubble";
+    bubble.textContent = message.content;
+    (message.sources || []).forEach((source, n) => {
+        const details = document.createElement("details");
+        const summary = document.createElement("summary");
+        summary.textContent = "🔍 Source " + (n + 1) + ": " + source.file_name +
+            " | Relevance: " + (source.similarity_score * 100).toFixed(1) + "%";
+        const text = document.createElement("div");
+        text.className = "source-text";
+        text.textContent = source.text;
+        details.append(summary, text);
+        bubble.appendChild(details);
+    });
+    row.appendChild(bubble);
+    return row;
+}
+
+function render() {
+    const top = viewport.scrollTop;
+    const first = Math.max(0, rowAt(top) - OVERSCAN);
+    const last = Math.min(count - 1, rowAt(top + viewport.clientHeight) + OVERSCAN);
+
+    for (const [i, row] of rendered) {
+        if (i < first || i > last) {
+            row.remove();
+            rendered.delete(i);
+        }
+    }
+
+    let dirty = -1;
+    for (let i = first; i <= last; i++) {
+        let row = rendered.get(i);
+        if (!row) {
+            row = build(i);
+            spacer.appendChild(row);
+            rendered.set(i, row);
+        }
+        const height = row.offsetHeight;
+        if (height !== heights[i]) {
+            heights[i] = height;
+            if (dirty < 0) dirty = i;
+        }
+    }
+    if (dirty >= 0) recompute(dirty);
+
+    for (const [i, row] of rendered) {
+        row.style.transform = "translateY(" + offsets[i] + "px)";
+    }
+}
+
+let scheduled = false;
+function schedule() {
+    if (!scheduled) {
+        scheduled = true;
+        requestAnimationFrame(() => { scheduled = false; render(); });
+    }
+}
+
+viewport.addEventListener("scroll", schedule);
+// Opening a source changes the row height; "toggle" does not bubble, so capture it
+spacer.addEventListener("toggle", schedule, true);
+
+// Start at the newest message; re-measure once the bottom rows have real heights
+recompute(0);
+for (let pass = 0; pass < 3; pass++) {
+    viewport.scrollTop = offsets[count];
+    render();
+}
+</script>
+"""
+
+def virtual_chat(messages, show_sources=True, height=600):
+    """Render the whole chat history in a virtualized scroll view
+
+    The message list is shipped to the browser once; only the rows in view are
+    turned into DOM nodes, so history length doesn't affect render cost.
+    """
+    rows = [
+        {
+            "role": message["role"],
+            "content": message["content"],
+            "sources": message.get("sources", []) if show_sources else []
+        }
+        for message in messages
+    ]
+    # Escape every "<": "</script>" in message text would close the script block and
+    # "<!--<script>" would hide its real end; "<" only occurs inside JSON strings, where
+    # \u003c decodes to the same text
+    payload = orjson.dumps(rows).decode().replace("<", "\\u003c")
+    html = _VIRTUAL_CHAT_TEMPLATE.replace("__HEIGHT__", str(height)).replace("__MESSAGES__", payload)
+    components.html(html, height=height)